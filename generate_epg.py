@@ -13,14 +13,76 @@ Changes from Stormglass version:
 
 import os
 import sys
+import io
+import gzip
+import json
+import logging
 import requests
 import time
-import xml.etree.ElementTree as ET
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from xml.sax.saxutils import escape
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- CONFIGURATION ---
 BASE_URL = "https://raw.githubusercontent.com/OiErU/weather-dashboard/main"
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+AI_CACHE_FILE = ".ai_cache.json"
+AI_CACHE_TTL = 26 * 3600  # Seconds before cached AI commentary is regenerated (daily runs + jitter)
+MAX_AI_WORKERS = 8  # Concurrent Gemini requests
+AI_BATCH_SIZE = 20  # Conditions sent per batched Gemini request
+AI_MAX_RETRIES = 3  # Attempts per Gemini request on rate limits and server errors
+HTTP_CACHE_FILE = "openmeteo_cache"  # requests-cache adds the .sqlite extension
+HTTP_CACHE_TTL = 1800  # Seconds an Open-Meteo response is reused
+HTTP_STALE_IF_ERROR = timedelta(hours=6)  # Oldest expired response used when Open-Meteo errors
+HTTP_TIMEOUT = (5, 45)  # Connect, read seconds: fail fast on a dead host, allow slow batched responses
+
+# --- LOGGING ---
+# Progress goes to stderr at INFO; per-location detail is DEBUG (shown with -v).
+# Only this script's logger is configured, so library loggers (httpx,
+# google-genai) stay at the root's WARNING default. Set up here rather than
+# in __main__ so the AI client setup below is logged.
+log = logging.getLogger("surf_epg")
+log.setLevel(logging.INFO)
+log.propagate = False
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(message)s"))
+log.addHandler(_log_handler)
+
+# --- HTTP SESSION ---
+# One keep-alive connection pool shared by every Open-Meteo call.
+# Retry covers connection errors and 429/5xx; read timeouts are re-raised
+# so the fetchers' own timeout/backoff loop still handles them.
+# With requests-cache installed, responses are also kept on disk so reruns
+# within HTTP_CACHE_TTL skip the network (Open-Meteo updates about hourly).
+# That only helps local runs and manual CI reruns: the scheduled runs are
+# further apart than the TTL, and Render starts from a fresh clone.
+# If Open-Meteo errors out (outage, 429), an expired copy up to
+# HTTP_STALE_IF_ERROR old is used instead. generate_xml lines every forecast
+# up by its own timestamps, so a copy fetched before midnight is read from
+# the right row rather than shifting every block by a day.
+try:
+    from requests_cache import CachedSession
+    SESSION = CachedSession(HTTP_CACHE_FILE, backend="sqlite", expire_after=HTTP_CACHE_TTL,
+                            allowable_methods=("GET",), stale_if_error=HTTP_STALE_IF_ERROR)
+except ImportError:
+    SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, read=False, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+# --- JSON PARSER ---
+# orjson decodes the long numeric hourly arrays several times faster than
+# the stdlib; both accept the raw response bytes
+try:
+    import orjson
+    parse_json = orjson.loads
+except ImportError:
+    parse_json = json.loads
 
 # --- AI CLIENT SETUP ---
 HAS_AI = False
@@ -30,13 +92,35 @@ try:
     if GEMINI_API_KEY:
         client = genai.Client(api_key=GEMINI_API_KEY)
         HAS_AI = True
-        print("✅ AI Client connected.")
+        log.info("✅ AI Client connected.")
     else:
-        print("⚠️ No GEMINI_API_KEY set - using fallback descriptions.")
+        log.warning("⚠️ No GEMINI_API_KEY set - using fallback descriptions.")
 except ImportError:
-    print("⚠️ google-genai library not found. Install with: pip install google-genai")
+    log.warning("⚠️ google-genai library not found. Install with: pip install google-genai")
 except Exception as e:
-    print(f"⚠️ AI Client failed: {e}")
+    log.warning(f"⚠️ AI Client failed: {e}")
+
+# Static part of the commentary prompt, sent as the Gemini system instruction
+AI_SYSTEM_PROMPT = (
+    "RIDEABILITY ASSESSMENT (apply first):\n"
+    "- Onshore wind over 25km/h with swell over 2m = messy, probably not worth it\n"
+    "- Swell over 5m at a beachbreak = dangerous closeouts, watching only\n"
+    "- Short periods (<8s) = weak, crumbly waves\n"
+    "- Offshore/light wind + 1-3m + 10s+ period = ideal\n"
+    "- Under 0.5m = flat, go get coffee\n\n"
+    
+    "TASK: Write ONE sentence (max 20 words) describing today's session prospects.\n\n"
+    
+    "TONE: Dry wit, understated. Like a local who's seen it all. "
+    "No forced slang, no 'brah', no exclamation marks. "
+    "If it's dangerous or blown out, say so plainly with a bit of dark humor. "
+    "If it's good, quiet confidence - you don't need to oversell it.\n\n"
+    
+    "Include the wave height naturally in your sentence."
+)
+
+# Variable part of the prompt, filled per forecast with str.format_map
+AI_CONDITIONS_TEMPLATE = "{height}m swell @ {period}s period, {wind_speed}km/h {wind_label} wind."
 
 # --- SPOTS CONFIGURATION ---
 # facing = direction the beach faces (where waves come FROM for ideal conditions)
@@ -107,6 +191,27 @@ SPOTS_CONFIG = {
     },
 }
 
+# Onshore wind is the offshore range turned around; work it out once per spot
+for spot in SPOTS_CONFIG.values():
+    offshore_start, offshore_end = spot["offshore_wind"]
+    spot["onshore_wind"] = ((offshore_start + 180) % 360, (offshore_end + 180) % 360)
+
+# --- FORECAST SERIES ---
+# Our series name -> Open-Meteo hourly variable, per endpoint. Only variables
+# get_hour_conditions reads are requested, to keep the responses small.
+MARINE_SERIES = {
+    "wave_height": "wave_height",
+    "swell_height": "swell_wave_height",
+    "swell_period": "swell_wave_period",
+    "swell_peak_period": "swell_wave_peak_period",
+    "wind_wave_height": "wind_wave_height",
+}
+WEATHER_SERIES = {
+    "wind_speed": "wind_speed_10m",
+    "wind_direction": "wind_direction_10m",
+    "wind_gusts": "wind_gusts_10m",
+}
+
 # --- CHANNELS MAP ---
 CHANNELS = [
     {"id": "ericeira-surfline", "spot": "ribeira", "name": "Surfline Ericeira", "logo": "ericeira.png?v=2", "poster": "ericeira_poster.jpg"},
@@ -123,78 +228,131 @@ CHANNELS = [
     {"id": "lagide-meo", "spot": "lagide", "name": "MEO Lagide", "logo": "lagide.png?v=2", "poster": "lagide_poster.jpg"},
 ]
 
+# Full icon URLs only depend on the channel; build them once
+for ch in CHANNELS:
+    ch["logo_url"] = f"{BASE_URL}/logos/{ch['logo']}"
+    ch["poster_url"] = f"{BASE_URL}/posters/{ch['poster']}"
+
+# Channels showing the same spot get identical programmes, so they are grouped
+# (spots and channels in CHANNELS order) and each spot is worked out once
+CHANNELS_BY_SPOT = {}
+for ch in CHANNELS:
+    CHANNELS_BY_SPOT.setdefault(ch["spot"], []).append(ch)
+
+# --- XMLTV OUTPUT ---
+# The document shape is fixed, so it is written straight from these templates
+# (escaped with xml.sax.saxutils) instead of building and indenting a tree
+XML_HEADER = (
+    "<?xml version='1.0' encoding='utf-8'?>\n"
+    '<tv generator-info-name="Surf EPG (Open-Meteo)" generator-info-url="{url}">\n'
+)
+CHANNEL_XML = (
+    '  <channel id="{id}">\n'
+    '    <display-name>{name}</display-name>\n'
+    '    <icon src="{icon}" />\n'
+    '  </channel>\n'
+)
+PROGRAMME_XML = (
+    '  <programme start="{start}" stop="{stop}" channel="{channel}">\n'
+    '    <title lang="en">{title}</title>\n'
+    '    <desc lang="en">{desc}</desc>\n'
+    '    <icon src="{icon}" />\n'
+    '  </programme>\n'
+)
+XML_FOOTER = "</tv>\n"
+NO_DATA_DESC = "No data available"  # Needs no escaping
+
+
+def escape_attr(value: str) -> str:
+    """Escape a value for a double-quoted XML attribute."""
+    return escape(value, {'"': "&quot;", "\n": "&#10;"})
 
-def get_openmeteo_marine_data(lat: float, lon: float, forecast_days: int = 3, max_retries: int = 5) -> dict | None:
-    """Fetch marine data from Open-Meteo API with retry logic."""
+
+# The channel list is the same on every run, so its XML is rendered once here
+CHANNELS_XML = "".join(
+    CHANNEL_XML.format(id=escape_attr(ch['id']), name=escape(ch['name']), icon=escape_attr(ch['logo_url']))
+    for ch in CHANNELS
+)
+
+
+def get_openmeteo_marine_data(lats: list[float], lons: list[float], forecast_days: int = 3,
+                              max_retries: int = 5) -> list[dict] | None:
+    """
+    Fetch marine data for several locations in one Open-Meteo request, with retry logic.
+    Returns one result per coordinate, in the order given.
+    """
     url = "https://marine-api.open-meteo.com/v1/marine"
     params = {
-        "latitude": lat,
-        "longitude": lon,
-        "hourly": [
-            "wave_height",
-            "wave_period",
-            "wave_direction",
-            "swell_wave_height",
-            "swell_wave_period",
-            "swell_wave_peak_period",
-            "swell_wave_direction",
-            "wind_wave_height",
-        ],
+        "latitude": ",".join(str(lat) for lat in lats),
+        "longitude": ",".join(str(lon) for lon in lons),
+        "hourly": list(MARINE_SERIES.values()),
         "forecast_days": forecast_days,
         "timezone": "Europe/Lisbon",
+        "timeformat": "unixtime",  # Integers instead of ISO strings: smaller and cheaper to parse
     }
     
     for attempt in range(max_retries):
         try:
-            r = requests.get(url, params=params, timeout=45)
+            r = SESSION.get(url, params=params, timeout=HTTP_TIMEOUT)
             r.raise_for_status()
-            return r.json()
+            data = parse_json(r.content)
+            # A single coordinate comes back as an object, several as a list
+            return data if isinstance(data, list) else [data]
         except requests.exceptions.Timeout:
-            print(f"   ⏱️ Timeout attempt {attempt + 1}/{max_retries} for marine data {lat},{lon}")
+            log.warning(f"   ⏱️ Timeout attempt {attempt + 1}/{max_retries} for marine data ({len(lats)} locations)")
             if attempt < max_retries - 1:
                 time.sleep(3 + attempt)  # Increasing delay: 3s, 4s, 5s, 6s
             continue
         except Exception as e:
-            print(f"⚠️ Marine API Error for {lat},{lon}: {e}")
+            log.warning(f"⚠️ Marine API Error: {e}")
             return None
     
-    print(f"⚠️ Marine API failed after {max_retries} retries for {lat},{lon}")
+    log.warning(f"⚠️ Marine API failed after {max_retries} retries")
     return None
 
 
-def get_openmeteo_weather_data(lat: float, lon: float, forecast_days: int = 3, max_retries: int = 5) -> dict | None:
-    """Fetch wind data from Open-Meteo Weather API with retry logic."""
+def get_openmeteo_weather_data(lats: list[float], lons: list[float], forecast_days: int = 3,
+                               max_retries: int = 5) -> list[dict] | None:
+    """
+    Fetch wind data for several locations in one Open-Meteo Weather API request, with retry logic.
+    Returns one result per coordinate, in the order given.
+    """
     url = "https://api.open-meteo.com/v1/forecast"
     params = {
-        "latitude": lat,
-        "longitude": lon,
-        "hourly": [
-            "wind_speed_10m",
-            "wind_direction_10m",
-            "wind_gusts_10m",
-        ],
+        "latitude": ",".join(str(lat) for lat in lats),
+        "longitude": ",".join(str(lon) for lon in lons),
+        "hourly": list(WEATHER_SERIES.values()),
         "forecast_days": forecast_days,
         "timezone": "Europe/Lisbon",
+        "timeformat": "unixtime",  # Integers instead of ISO strings: smaller and cheaper to parse
     }
     
     for attempt in range(max_retries):
         try:
-            r = requests.get(url, params=params, timeout=45)
+            r = SESSION.get(url, params=params, timeout=HTTP_TIMEOUT)
             r.raise_for_status()
-            return r.json()
+            data = parse_json(r.content)
+            # A single coordinate comes back as an object, several as a list
+            return data if isinstance(data, list) else [data]
         except requests.exceptions.Timeout:
-            print(f"   ⏱️ Timeout attempt {attempt + 1}/{max_retries} for weather data {lat},{lon}")
+            log.warning(f"   ⏱️ Timeout attempt {attempt + 1}/{max_retries} for weather data ({len(lats)} locations)")
             if attempt < max_retries - 1:
                 time.sleep(3 + attempt)  # Increasing delay: 3s, 4s, 5s, 6s
             continue
         except Exception as e:
-            print(f"⚠️ Weather API Error for {lat},{lon}: {e}")
+            log.warning(f"⚠️ Weather API Error: {e}")
             return None
     
-    print(f"⚠️ Weather API failed after {max_retries} retries for {lat},{lon}")
+    log.warning(f"⚠️ Weather API failed after {max_retries} retries")
     return None
 
 
+def in_direction_range(degrees: float, direction_range: tuple) -> bool:
+    """Check a bearing against an inclusive (start, end) range, which may cross 0 degrees."""
+    start, end = direction_range
+    return (degrees - start) % 360 <= (end - start) % 360
+
+
 def get_wind_label(wind_deg: float, spot_config: dict) -> str:
     """
     Determine if wind is offshore, onshore, or cross-shore for a specific spot.
@@ -203,39 +361,24 @@ def get_wind_label(wind_deg: float, spot_config: dict) -> str:
     if wind_deg is None:
         return "UNKNOWN"
     
-    offshore_range = spot_config.get("offshore_wind", (0, 90))
-    start, end = offshore_range
-    
-    # Handle ranges that cross 0 degrees (e.g., 315 to 45)
-    if start > end:
-        is_offshore = wind_deg >= start or wind_deg <= end
-    else:
-        is_offshore = start <= wind_deg <= end
-    
-    if is_offshore:
+    if in_direction_range(wind_deg, spot_config["offshore_wind"]):
         return "OFFSHORE"
     
     # Check if it's directly onshore (opposite of offshore)
-    onshore_start = (start + 180) % 360
-    onshore_end = (end + 180) % 360
-    
-    if onshore_start > onshore_end:
-        is_onshore = wind_deg >= onshore_start or wind_deg <= onshore_end
-    else:
-        is_onshore = onshore_start <= wind_deg <= onshore_end
-    
-    if is_onshore:
+    if in_direction_range(wind_deg, spot_config["onshore_wind"]):
         return "ONSHORE"
     
     return "CROSS"
 
 
+COMPASS_POINTS = ("N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
+                  "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW")
+
+
 def get_wind_compass(degrees: float) -> str:
     """Convert wind degrees to compass direction."""
-    directions = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
-                  "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
     idx = round(degrees / 22.5) % 16
-    return directions[idx]
+    return COMPASS_POINTS[idx]
 
 
 def assess_conditions(swell_height: float, swell_period: float, wind_speed: float, 
@@ -288,6 +431,96 @@ def assess_conditions(swell_height: float, swell_period: float, wind_speed: floa
     }
 
 
+def get_hour_conditions(series: dict, i: int, spot_config: dict) -> dict:
+    """Round one forecast hour's values and derive wind labels and the condition assessment."""
+    # Extract values with fallbacks
+    swell_height = series['swell_height'][i] or series['wave_height'][i] or 0
+    swell_period = series['swell_peak_period'][i] or series['swell_period'][i] or 0
+    wind_wave_height = series['wind_wave_height'][i] or 0
+    wind_speed = series['wind_speed'][i] or 0
+    wind_direction = series['wind_direction'][i] or 0
+    wind_gusts = series['wind_gusts'][i] or 0
+    
+    # Round values
+    swell_height = round(float(swell_height), 1)
+    swell_period = round(float(swell_period), 0)
+    wind_wave_height = round(float(wind_wave_height), 1)
+    wind_speed = round(float(wind_speed), 0)
+    wind_gusts = round(float(wind_gusts), 0)
+    
+    # Get wind label
+    wind_label = get_wind_label(wind_direction, spot_config)
+    wind_compass = get_wind_compass(wind_direction)
+    
+    # Assess conditions
+    assessment = assess_conditions(
+        swell_height, swell_period, wind_speed, 
+        wind_label, wind_wave_height
+    )
+    
+    return {
+        "swell_height": swell_height,
+        "swell_period": swell_period,
+        "wind_wave_height": wind_wave_height,
+        "wind_speed": wind_speed,
+        "wind_gusts": wind_gusts,
+        "wind_label": wind_label,
+        "wind_compass": wind_compass,
+        "assessment": assessment,
+    }
+
+
+def format_programme(conditions: dict, ai_text: str) -> tuple[str, str]:
+    """Build the programme title and description for one set of conditions."""
+    swell_height = conditions['swell_height']
+    swell_period = int(conditions['swell_period'])
+    wind_label = conditions['wind_label']
+    assessment = conditions['assessment']
+    
+    title = f"{assessment['rating']} {swell_height}m @ {swell_period}s {wind_label}"
+    
+    desc_lines = [
+        ai_text,
+        "",
+        f"🌊 Swell: {swell_height}m @ {swell_period}s",
+        f"💨 Wind: {conditions['wind_speed']}km/h {conditions['wind_compass']} ({wind_label})",
+        f"💨 Gusts: {conditions['wind_gusts']}km/h",
+        f"🌊 Wind waves: {conditions['wind_wave_height']}m",
+    ]
+    
+    if assessment['notes']:
+        desc_lines.append("")
+        desc_lines.append("📋 " + " • ".join(assessment['notes']))
+    
+    return title, "\n".join(desc_lines)
+
+
+def generate_ai_content(prompt: str, config: dict, max_retries: int = AI_MAX_RETRIES):
+    """
+    Call Gemini, retrying rate limits (429) and server errors with backoff.
+    Other errors, or the last failed attempt, are raised to the caller.
+    """
+    for attempt in range(max_retries):
+        try:
+            return client.models.generate_content(
+                model='gemini-2.0-flash', contents=prompt, config=config,
+            )
+        except Exception as e:
+            if attempt == max_retries - 1 or getattr(e, "code", None) not in (429, 500, 502, 503, 504):
+                raise
+            log.warning(f"   ⏱️ AI retry {attempt + 1}/{max_retries}: {e}")
+            time.sleep(0.5 * 2 ** attempt)  # Increasing delay: 0.5s, 1s, ...
+
+
+def format_ai_conditions(swell_height: float, swell_period: float, wind_speed: float,
+                         wind_label: str) -> str:
+    """Fill AI_CONDITIONS_TEMPLATE for one forecast."""
+    return AI_CONDITIONS_TEMPLATE.format_map({
+        "height": swell_height, "period": swell_period,
+        "wind_speed": wind_speed, "wind_label": wind_label.lower(),
+    })
+
+
 def get_ai_commentary(spot_name: str, swell_height: float, swell_period: float, 
                       wind_speed: float, wind_label: str, assessment: dict) -> str:
     """Generate AI commentary for surf conditions."""
@@ -297,63 +530,171 @@ def get_ai_commentary(spot_name: str, swell_height: float, swell_period: float,
             return f"{swell_height}m - not ideal for surfing right now."
         return f"{swell_height}m @ {swell_period}s with {wind_label.lower()} winds."
 
+    # Only the conditions change per call; the instructions go in AI_SYSTEM_PROMPT
     prompt = (
         f"You're an experienced local bodyboarder at {spot_name}, Portugal. "
-        f"Current conditions: {swell_height}m swell @ {swell_period}s period, "
-        f"{wind_speed}km/h {wind_label.lower()} wind.\n\n"
-        
-        "RIDEABILITY ASSESSMENT (apply first):\n"
-        "- Onshore wind over 25km/h with swell over 2m = messy, probably not worth it\n"
-        "- Swell over 5m at a beachbreak = dangerous closeouts, watching only\n"
-        "- Short periods (<8s) = weak, crumbly waves\n"
-        "- Offshore/light wind + 1-3m + 10s+ period = ideal\n"
-        "- Under 0.5m = flat, go get coffee\n\n"
-        
-        "TASK: Write ONE sentence (max 20 words) describing today's session prospects.\n\n"
-        
-        "TONE: Dry wit, understated. Like a local who's seen it all. "
-        "No forced slang, no 'brah', no exclamation marks. "
-        "If it's dangerous or blown out, say so plainly with a bit of dark humor. "
-        "If it's good, quiet confidence - you don't need to oversell it.\n\n"
-        
-        "Include the wave height naturally in your sentence."
+        "Current conditions: " + format_ai_conditions(swell_height, swell_period, wind_speed, wind_label)
     )
 
     try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=prompt
-        )
+        response = generate_ai_content(prompt, {"system_instruction": AI_SYSTEM_PROMPT})
         if response.text:
             return response.text.strip().replace('"', '').replace('\n', ' ')
         return f"{swell_height}m swell (AI silent)"
     except Exception as e:
-        print(f"⚠️ AI Error: {e}")
+        log.warning(f"⚠️ AI Error: {e}")
         return f"{swell_height}m swell (AI error)"
 
 
+# Gemini response schema for batched commentary: one report per numbered entry
+AI_BATCH_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"i": {"type": "INTEGER"}, "report": {"type": "STRING"}},
+        "required": ["i", "report"],
+    },
+}
+
+
+def get_ai_commentary_batch(entries: list[tuple]) -> list[str | None] | None:
+    """
+    Generate AI commentary for several conditions in one Gemini request.
+    `entries` holds get_ai_commentary argument tuples; the result lines up with
+    it, with None wherever the response skipped an entry or couldn't be parsed
+    (the caller falls back to per-spot requests for those). Returns None only
+    if the request itself fails after generate_ai_content's retries, so a
+    rate-limited API isn't hit with a per-spot call for every entry.
+    """
+    lines = [
+        f"{i}. {spot_name}: " + format_ai_conditions(swell_height, swell_period, wind_speed, wind_label)
+        for i, (spot_name, swell_height, swell_period, wind_speed, wind_label, _) in enumerate(entries)
+    ]
+    prompt = (
+        "You're an experienced local bodyboarder in Portugal. "
+        f"Write one report for each of these {len(entries)} numbered forecasts, "
+        "returning its number as i:\n" + "\n".join(lines)
+    )
+    
+    try:
+        response = generate_ai_content(prompt, {
+            "system_instruction": AI_SYSTEM_PROMPT,
+            "response_mime_type": "application/json",
+            "response_schema": AI_BATCH_SCHEMA,
+        })
+    except Exception as e:
+        log.warning(f"⚠️ AI batch error: {e}")
+        return None
+    
+    reports = [None] * len(entries)
+    try:
+        for item in parse_json(response.text or "[]"):
+            i, text = item.get("i"), item.get("report")
+            if isinstance(i, int) and 0 <= i < len(entries) and isinstance(text, str) and text:
+                reports[i] = text.strip().replace('"', '').replace('\n', ' ')
+    except (ValueError, TypeError, AttributeError) as e:
+        log.warning(f"⚠️ AI batch response unreadable, asking per spot: {e}")
+        return [None] * len(entries)
+    return reports
+
+
+def store_ai_batch(batch: list[str], reports: list[str | None] | None,
+                   ai_pending: dict, ai_cache: dict) -> list[str]:
+    """
+    Store a finished batch's reports in ai_cache and return the keys it left
+    out. A failed batch (reports is None) stores the error text for every key,
+    which save_ai_cache then skips.
+    """
+    missing = []
+    for i, key in enumerate(batch):
+        if reports is None:
+            ai_cache[key] = {"text": f"{ai_pending[key][1]}m swell (AI error)", "ts": time.time()}
+        elif reports[i]:
+            ai_cache[key] = {"text": reports[i], "ts": time.time()}
+        else:
+            missing.append(key)
+    return missing
+
+
+def get_ai_cache_key(spot_name: str, swell_height: float, swell_period: float,
+                     wind_speed: float, wind_label: str, assessment: dict) -> str:
+    """
+    Bucket conditions so equivalent forecasts share one AI commentary.
+    Wind speed is grouped in 5km/h steps; the key is a string so it survives JSON.
+    """
+    return "|".join(str(part) for part in (
+        spot_name, swell_height, int(swell_period), int(wind_speed) // 5,
+        wind_label, assessment["is_rideable"],
+    ))
+
+
+def load_ai_cache(path: str = AI_CACHE_FILE) -> dict:
+    """
+    Load persisted AI commentary, dropping entries older than AI_CACHE_TTL.
+    A missing, corrupt or oddly shaped file just means an empty cache.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        cutoff = time.time() - AI_CACHE_TTL
+        return {
+            key: entry for key, entry in entries.items()
+            if isinstance(entry.get("text"), str) and entry.get("ts", 0) >= cutoff
+        }
+    except (OSError, ValueError, AttributeError, TypeError):
+        return {}
+
+
+def save_ai_cache(ai_cache: dict, path: str = AI_CACHE_FILE):
+    """Persist real AI commentary for the next run (fallback and error texts are skipped)."""
+    entries = {
+        key: entry for key, entry in ai_cache.items()
+        if not entry["text"].endswith(("(AI silent)", "(AI error)"))
+    }
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+    except OSError as e:
+        log.warning(f"⚠️ Could not save AI cache: {e}")
+
+
+def align_series(values: list | None, length: int) -> list:
+    """Pad or trim an hourly series to `length` entries, filling gaps with None."""
+    if values is not None and len(values) == length:
+        return values  # Already aligned (the usual case): keep the parsed list as-is
+    values = list(values or [])[:length]
+    return values + [None] * (length - len(values))
+
+
 def fetch_all_spot_data(forecast_days: int = 3) -> dict:
     """
     Fetch marine and weather data for all unique coordinates.
-    Returns a dict keyed by "lat,lon" with combined data.
+    Returns a dict keyed by (lat, lon); each value maps series name -> hourly values,
+    plus the response's utc_offset_seconds for reading the unixtime "time" series.
     """
     data_cache = {}
     
     # Get unique coordinates
-    unique_coords = {}
+    unique_coords = {}  # (lat, lon) -> first spot name at that point
     for spot_id, spot in SPOTS_CONFIG.items():
-        coord_key = f"{spot['lat']},{spot['lon']}"
-        if coord_key not in unique_coords:
-            unique_coords[coord_key] = (spot['lat'], spot['lon'], spot['name'])
-    
-    print(f"🌊 Fetching data for {len(unique_coords)} unique locations...")
-    print(f"   Coordinates to fetch: {list(unique_coords.keys())}")
-    
-    for coord_key, (lat, lon, name) in unique_coords.items():
-        print(f"   📍 Fetching {name} ({coord_key})...")
-        
-        marine_data = get_openmeteo_marine_data(lat, lon, forecast_days)
-        weather_data = get_openmeteo_weather_data(lat, lon, forecast_days)
+        unique_coords.setdefault((spot['lat'], spot['lon']), spot['name'])
+    
+    log.info(f"🌊 Fetching data for {len(unique_coords)} unique locations...")
+    log.debug(f"   Coordinates to fetch: {list(unique_coords.keys())}")
+    
+    # One request per endpoint covers every coordinate; run the two side by side
+    coord_keys = list(unique_coords)
+    lats = [lat for lat, lon in coord_keys]
+    lons = [lon for lat, lon in coord_keys]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        marine_future = executor.submit(get_openmeteo_marine_data, lats, lons, forecast_days)
+        weather_future = executor.submit(get_openmeteo_weather_data, lats, lons, forecast_days)
+        marine_results = marine_future.result() or [None] * len(coord_keys)
+        weather_results = weather_future.result() or [None] * len(coord_keys)
+    
+    for coord_key, marine_data, weather_data in zip(coord_keys, marine_results, weather_results):
+        name = unique_coords[coord_key]
+        log.debug(f"   📍 {name} {coord_key}...")
         
         if marine_data and weather_data:
             # Check if marine data actually has values
@@ -362,184 +703,224 @@ def fetch_all_spot_data(forecast_days: int = 3) -> dict:
             first_swell = swell_heights[0] if swell_heights else None
             
             if first_swell is None:
-                print(f"   ⚠️ {name}: Marine API returned but swell_wave_height is None/empty!")
+                log.warning(f"   ⚠️ {name}: Marine API returned but swell_wave_height is None/empty!")
             
-            # Combine hourly data
-            hours = []
+            # Store each variable as one column aligned to the marine time axis
             weather_hourly = weather_data.get("hourly", {})
-            
             times = marine_hourly.get("time", [])
-            for i, t in enumerate(times):
-                hours.append({
-                    "time": t,
-                    "wave_height": marine_hourly.get("wave_height", [None])[i] if i < len(marine_hourly.get("wave_height", [])) else None,
-                    "wave_period": marine_hourly.get("wave_period", [None])[i] if i < len(marine_hourly.get("wave_period", [])) else None,
-                    "wave_direction": marine_hourly.get("wave_direction", [None])[i] if i < len(marine_hourly.get("wave_direction", [])) else None,
-                    "swell_height": marine_hourly.get("swell_wave_height", [None])[i] if i < len(marine_hourly.get("swell_wave_height", [])) else None,
-                    "swell_period": marine_hourly.get("swell_wave_period", [None])[i] if i < len(marine_hourly.get("swell_wave_period", [])) else None,
-                    "swell_peak_period": marine_hourly.get("swell_wave_peak_period", [None])[i] if i < len(marine_hourly.get("swell_wave_peak_period", [])) else None,
-                    "swell_direction": marine_hourly.get("swell_wave_direction", [None])[i] if i < len(marine_hourly.get("swell_wave_direction", [])) else None,
-                    "wind_wave_height": marine_hourly.get("wind_wave_height", [None])[i] if i < len(marine_hourly.get("wind_wave_height", [])) else None,
-                    "wind_speed": weather_hourly.get("wind_speed_10m", [None])[i] if i < len(weather_hourly.get("wind_speed_10m", [])) else None,
-                    "wind_direction": weather_hourly.get("wind_direction_10m", [None])[i] if i < len(weather_hourly.get("wind_direction_10m", [])) else None,
-                    "wind_gusts": weather_hourly.get("wind_gusts_10m", [None])[i] if i < len(weather_hourly.get("wind_gusts_10m", [])) else None,
-                })
+            series = {"time": times, "utc_offset_seconds": marine_data.get("utc_offset_seconds", 0)}
+            for key, variable in MARINE_SERIES.items():
+                series[key] = align_series(marine_hourly.get(variable), len(times))
+            for key, variable in WEATHER_SERIES.items():
+                series[key] = align_series(weather_hourly.get(variable), len(times))
             
-            data_cache[coord_key] = {"hours": hours}
-            print(f"   ✅ Got {len(hours)} hours of data (first swell: {first_swell}m)")
+            data_cache[coord_key] = series
+            log.debug(f"   ✅ Got {len(times)} hours of data (first swell: {first_swell}m)")
         else:
-            print(f"   ❌ Failed to fetch data for {name}")
+            log.error(f"   ❌ Failed to fetch data for {name}")
             if not marine_data:
-                print(f"      Marine data: None")
+                log.error(f"      Marine data: None")
             if not weather_data:
-                print(f"      Weather data: None")
-        
-        time.sleep(0.5)  # Be polite to the API
+                log.error(f"      Weather data: None")
     
     # Summary of what we got
-    print(f"\n📊 Data cache summary:")
+    log.debug(f"\n📊 Data cache summary:")
     for key in data_cache:
-        print(f"   ✅ {key}")
+        log.debug(f"   ✅ {key}")
     
     # Check which spots will have data
-    print(f"\n🔍 Spot -> Coordinate mapping:")
+    log.debug(f"\n🔍 Spot -> Coordinate mapping:")
     for spot_id, spot in SPOTS_CONFIG.items():
-        coord_key = f"{spot['lat']},{spot['lon']}"
+        coord_key = (spot['lat'], spot['lon'])
         has_data = coord_key in data_cache
         status = "✅" if has_data else "❌"
-        print(f"   {status} {spot['name']}: {coord_key}")
+        log.debug(f"   {status} {spot['name']}: {coord_key}")
     
     return data_cache
 
 
-def generate_xml(days: int = 1, output_file: str = "surf_epg.xml"):
-    """Generate XMLTV EPG file."""
-    root = ET.Element("tv")
-    root.set("generator-info-name", "Surf EPG (Open-Meteo)")
-    root.set("generator-info-url", BASE_URL)
-    
+def get_hour_offset(series: dict, start_of_day: datetime) -> int:
+    """
+    Hours from a forecast's first row to `start_of_day` (naive local time).
+    Row times are unixtime; adding the response's utc_offset_seconds gives the
+    wall-clock hour they start at, normally midnight of the day it was fetched.
+    """
+    first_row = datetime.fromtimestamp(series['time'][0] + series['utc_offset_seconds'], timezone.utc)
+    return round((start_of_day - first_row.replace(tzinfo=None)).total_seconds() / 3600)
+
+
+def format_xmltv_time(dt: datetime) -> str:
+    """Format a datetime as an XMLTV timestamp (same output as strftime("%Y%m%d%H%M%S +0000"))."""
+    return f"{dt.year:04d}{dt.month:02d}{dt.day:02d}{dt.hour:02d}{dt.minute:02d}{dt.second:02d} +0000"
+
+
+def open_output(path: str):
+    """Open the EPG for writing as text, compressed on the fly if the name ends in .gz."""
+    if path.endswith(".gz"):
+        # mtime=0 keeps the archive byte-identical when the guide hasn't changed,
+        # so the publish scripts' "no changes" check still works
+        return io.TextIOWrapper(gzip.GzipFile(path, "wb", mtime=0), encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+def submit_ai_batch(batch: list[str], ai_pending: dict, ai_batches: dict, executor):
+    """Send one batch of uncached AI keys to Gemini and record its future per key."""
+    future = executor.submit(get_ai_commentary_batch, [ai_pending[key] for key in batch])
+    for key in batch:
+        ai_batches[key] = (batch, future)
+
+
+def generate_xml(days: int = 1, output_file: str = "surf_epg.xml", gzip_copy: bool = False):
+    """
+    Generate XMLTV EPG file, plus `<output_file>.gz` in the same pass if gzip_copy
+    is set (ignored when output_file already ends in .gz).
+    """
     # Fetch all data
-    weather_cache = fetch_all_spot_data(forecast_days=days + 1)
+    # The last block read is hour (days - 1) * 24 + 18, so `days` of data is enough
+    weather_cache = fetch_all_spot_data(forecast_days=days)
     
     if not weather_cache:
-        print("❌ No data fetched. Exiting.")
+        log.error("❌ No data fetched. Exiting.")
         return
     
-    # Add channel headers
-    for ch in CHANNELS:
-        channel = ET.SubElement(root, "channel", id=ch["id"])
-        ET.SubElement(channel, "display-name").text = ch["name"]
-        ET.SubElement(channel, "icon", src=f"{BASE_URL}/logos/{ch['logo']}")
-
     # Build programs
     now = datetime.now()
     start_of_today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    ai_cache = {}  # Cache AI responses to avoid duplicate calls
+    ai_cache = load_ai_cache() if HAS_AI else {}  # AI responses keyed by condition bucket
 
-    print(f"\n📺 Generating {days} day(s) of EPG data...")
-    
+    log.info(f"\n📺 Generating {days} day(s) of EPG data...")
+    
+    # Pass 1: work out conditions for every programme. Uncached AI keys are
+    # sent to Gemini as soon as AI_BATCH_SIZE of them have been collected, so
+    # Gemini works while we carry on; the pool size caps concurrent requests
+    # in place of the old per-call sleep. Per-spot requests are only made for
+    # reports a successful batch left out; a batch that fails outright gets
+    # the error text rather than a burst of calls against a rate-limited API.
+    programmes = []  # (spot_channels, start_fmt, stop_fmt, conditions, ai_key, error)
+    ai_pending = {}  # ai_key -> get_ai_commentary args, in first-seen order
+    ai_batch = []  # Uncached keys not yet sent to Gemini
+    ai_batches = {}  # ai_key -> (keys in its batch, Future for the batch reports)
+    ai_futures = {}  # ai_key -> Future for per-spot commentary
+    
+    # Per-spot values are resolved once: config, data, the row holding today's
+    # midnight and the last row (both None without data), and the escaped
+    # channel fields
+    spot_context = []
+    for spot_id, channels in CHANNELS_BY_SPOT.items():
+        spot_channels = [
+            (escape_attr(ch['id']), escape(ch['name']), escape_attr(ch['poster_url']))
+            for ch in channels
+        ]
+        spot_config = SPOTS_CONFIG[spot_id]
+        spot_data = weather_cache.get((spot_config['lat'], spot_config['lon']))
+        first_idx = last_idx = None
+        if spot_data and spot_data['time']:
+            first_idx = get_hour_offset(spot_data, start_of_today)
+            last_idx = len(spot_data['time']) - 1
+            if first_idx:
+                log.warning(f"⚠️ {spot_config['name']}: forecast doesn't start at today's midnight, "
+                            f"shifting by {first_idx}h")
+        spot_context.append((spot_id, spot_config, spot_data, first_idx, last_idx, spot_channels))
+    
+    # Time slots: 4 x 6-hour blocks per day, with XMLTV times formatted once
+    # and the hour index to read from the forecast data
+    slots = []
     for day in range(days):
-        for block in range(4):  # 4 x 6-hour blocks per day
+        for block in range(4):
             block_hour = block * 6
             program_start = start_of_today + timedelta(days=day, hours=block_hour)
             program_stop = program_start + timedelta(hours=6)
-            
-            # Calculate which hour index to use in the data
-            hours_from_start = (day * 24) + block_hour
-            
-            for ch in CHANNELS:
-                spot_id = ch['spot']
-                spot_config = SPOTS_CONFIG[spot_id]
-                coord_key = f"{spot_config['lat']},{spot_config['lon']}"
-                spot_data = weather_cache.get(coord_key)
+            slots.append((
+                day, block, format_xmltv_time(program_start), format_xmltv_time(program_stop),
+                (day * 24) + block_hour,
+            ))
+    
+    with ThreadPoolExecutor(max_workers=MAX_AI_WORKERS) as ai_executor:
+        for day, block, start_fmt, stop_fmt, hours_from_start in slots:
+            for spot_id, spot_config, spot_data, first_idx, last_idx, spot_channels in spot_context:
+                conditions = ai_key = error = None
                 
-                title = ch['name']
-                desc = "No data available"
-                icon_src = f"{BASE_URL}/posters/{ch['poster']}"
-
-                if spot_data and 'hours' in spot_data:
-                    hours_list = spot_data['hours']
-                    
-                    # Get the hour data, clamping to available range
-                    hour_idx = min(hours_from_start, len(hours_list) - 1)
-                    h = hours_list[hour_idx]
-                    
+                # Blocks outside the rows we have (e.g. the last day of a stale
+                # copy) get "No data" rather than a neighbouring hour's forecast
+                hour_idx = first_idx + hours_from_start if first_idx is not None else -1
+                if 0 <= hour_idx <= last_idx:
                     try:
-                        # Extract values with fallbacks
-                        swell_height = h.get('swell_height') or h.get('wave_height') or 0
-                        swell_period = h.get('swell_peak_period') or h.get('swell_period') or 0
-                        wind_wave_height = h.get('wind_wave_height') or 0
-                        wind_speed = h.get('wind_speed') or 0
-                        wind_direction = h.get('wind_direction') or 0
-                        wind_gusts = h.get('wind_gusts') or 0
-                        
-                        # Round values
-                        swell_height = round(float(swell_height), 1)
-                        swell_period = round(float(swell_period), 0)
-                        wind_wave_height = round(float(wind_wave_height), 1)
-                        wind_speed = round(float(wind_speed), 0)
-                        wind_gusts = round(float(wind_gusts), 0)
+                        conditions = get_hour_conditions(spot_data, hour_idx, spot_config)
                         
-                        # Get wind label
-                        wind_label = get_wind_label(wind_direction, spot_config)
-                        wind_compass = get_wind_compass(wind_direction)
-                        
-                        # Assess conditions
-                        assessment = assess_conditions(
-                            swell_height, swell_period, wind_speed, 
-                            wind_label, wind_wave_height
+                        ai_args = (
+                            spot_config['name'], conditions['swell_height'], conditions['swell_period'],
+                            conditions['wind_speed'], conditions['wind_label'], conditions['assessment']
                         )
-                        
-                        # Get AI commentary (with caching)
-                        ai_key = f"{spot_id}-{day}-{block}"
-                        if ai_key not in ai_cache:
-                            print(f"   🤖 AI for {spot_config['name']} (day {day+1}, block {block+1})...")
-                            ai_text = get_ai_commentary(
-                                spot_config['name'], swell_height, swell_period,
-                                wind_speed, wind_label, assessment
-                            )
-                            ai_cache[ai_key] = ai_text
-                            time.sleep(0.5)  # Rate limit AI calls
-                        else:
-                            ai_text = ai_cache[ai_key]
-                        
-                        # Build title and description
-                        title = f"{assessment['rating']} {swell_height}m @ {int(swell_period)}s {wind_label}"
-                        
-                        desc_lines = [
-                            ai_text,
-                            "",
-                            f"🌊 Swell: {swell_height}m @ {int(swell_period)}s",
-                            f"💨 Wind: {wind_speed}km/h {wind_compass} ({wind_label})",
-                            f"💨 Gusts: {wind_gusts}km/h",
-                            f"🌊 Wind waves: {wind_wave_height}m",
-                        ]
-                        
-                        if assessment['notes']:
-                            desc_lines.append("")
-                            desc_lines.append("📋 " + " • ".join(assessment['notes']))
-                        
-                        desc = "\n".join(desc_lines)
-                        
+                        ai_key = get_ai_cache_key(*ai_args)
+                        if ai_key not in ai_cache and ai_key not in ai_pending:
+                            ai_pending[ai_key] = ai_args
+                            ai_batch.append(ai_key)
+                            if HAS_AI and len(ai_batch) == AI_BATCH_SIZE:
+                                submit_ai_batch(ai_batch, ai_pending, ai_batches, ai_executor)
+                                ai_batch = []
+                    
                     except Exception as e:
-                        print(f"⚠️ Error processing {spot_id}: {e}")
-                        desc = f"Error: {e}"
-
-                # Format times for XMLTV
-                start_fmt = program_start.strftime("%Y%m%d%H%M%S +0000")
-                stop_fmt = program_stop.strftime("%Y%m%d%H%M%S +0000")
+                        log.warning(f"⚠️ Error processing {spot_id}: {e}")
+                        conditions, error = None, e
                 
-                prog = ET.SubElement(root, "programme", start=start_fmt, stop=stop_fmt, channel=ch["id"])
-                ET.SubElement(prog, "title", lang="en").text = title
-                ET.SubElement(prog, "desc", lang="en").text = desc
-                ET.SubElement(prog, "icon", src=icon_src)
-
-    # Write XML
-    tree = ET.ElementTree(root)
-    ET.indent(tree, space="  ", level=0)
-    tree.write(output_file, encoding="utf-8", xml_declaration=True)
-    print(f"\n✅ EPG generated: {output_file}")
-    print(f"   📊 {len(CHANNELS)} channels × {days * 4} time blocks = {len(CHANNELS) * days * 4} programs")
+                programmes.append((spot_channels, start_fmt, stop_fmt, conditions, ai_key, error))
+        
+        if HAS_AI:
+            if ai_batch:
+                submit_ai_batch(ai_batch, ai_pending, ai_batches, ai_executor)
+            if ai_pending:
+                batch_count = -(-len(ai_pending) // AI_BATCH_SIZE)  # Batches are full except the last
+                log.info(f"   🤖 AI for {len(ai_pending)} forecast(s) in {batch_count} batch(es)...")
+        else:
+            # Fallback descriptions only; no batching needed
+            for key, ai_args in ai_pending.items():
+                ai_futures[key] = ai_executor.submit(get_ai_commentary, *ai_args)
+    
+        # Pass 2: write the XML, formatting each spot's text once and waiting
+        # on each AI batch (and any per-spot fallback) only when the first
+        # programme that needs it is reached
+        # A .gz output_file is already compressed, so there is no second copy
+        output_files = [output_file]
+        if gzip_copy and not output_file.endswith(".gz"):
+            output_files.append(output_file + ".gz")
+        with ExitStack() as stack:
+            outputs = [stack.enter_context(open_output(path)) for path in output_files]
+            
+            def write(text: str):
+                for out in outputs:
+                    out.write(text)
+            
+            write(XML_HEADER.format(url=escape_attr(BASE_URL)))
+            write(CHANNELS_XML)
+            
+            for spot_channels, start_fmt, stop_fmt, conditions, ai_key, error in programmes:
+                title = None
+                if conditions:
+                    if ai_key not in ai_cache and ai_key not in ai_futures:
+                        batch, future = ai_batches[ai_key]
+                        for key in store_ai_batch(batch, future.result(), ai_pending, ai_cache):
+                            ai_futures[key] = ai_executor.submit(get_ai_commentary, *ai_pending[key])
+                    if ai_key not in ai_cache:
+                        ai_cache[ai_key] = {"text": ai_futures[ai_key].result(), "ts": time.time()}
+                    title, desc = format_programme(conditions, ai_cache[ai_key]["text"])
+                    desc = escape(desc)
+                elif error:
+                    desc = escape(f"Error: {error}")
+                else:
+                    desc = NO_DATA_DESC
+                
+                for channel_id, channel_name, poster_url in spot_channels:
+                    write(PROGRAMME_XML.format(
+                        start=start_fmt, stop=stop_fmt, channel=channel_id,
+                        title=escape(title) if title else channel_name, desc=desc, icon=poster_url,
+                    ))
+            
+            write(XML_FOOTER)
+    
+    if HAS_AI:
+        save_ai_cache(ai_cache)
+    log.info(f"\n✅ EPG generated: {', '.join(output_files)}")
+    log.info(f"   📊 {len(CHANNELS)} channels × {days * 4} time blocks = {len(CHANNELS) * days * 4} programs")
 
 
 if __name__ == "__main__":
@@ -547,8 +928,12 @@ if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description="Generate Surf EPG from Open-Meteo data")
     parser.add_argument("-d", "--days", type=int, default=1, help="Number of days to generate (default: 1)")
-    parser.add_argument("-o", "--output", type=str, default="surf_epg.xml", help="Output filename (default: surf_epg.xml)")
+    parser.add_argument("-o", "--output", type=str, default="surf_epg.xml", help="Output filename, gzipped if it ends in .gz (default: surf_epg.xml)")
+    parser.add_argument("-z", "--gzip", action="store_true", help="Also write a gzipped copy (<output>.gz)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show per-location fetch details")
     
     args = parser.parse_args()
+    if args.verbose:
+        log.setLevel(logging.DEBUG)
     
-    generate_xml(days=args.days, output_file=args.output)
+    generate_xml(days=args.days, output_file=args.output, gzip_copy=args.gzip)
@@ -6,16 +6,18 @@ set -e  # Exit on any error
 
 echo "🏄 Starting Surf EPG update..."
 
-# Clone your repo (shallow clone for speed)
+# Clone your repo (shallow clone for speed). Every run starts from this fresh
+# clone, so .ai_cache.json and openmeteo_cache.sqlite are never carried over
+# here: all AI commentary and forecasts are fetched live.
 git clone --depth 1 https://${GITHUB_TOKEN}@github.com/OiErU/weather-dashboard.git repo
 cd repo
 
 # Run the EPG generator
 echo "🌊 Generating EPG..."
-python generate_epg.py -d 2
+python generate_epg.py -d 2 --gzip  # Also writes surf_epg.xml.gz for XMLTV clients that accept it
 
 # Check if file changed
-if git diff --quiet surf_epg.xml; then
+if git diff --quiet surf_epg.xml && git ls-files --error-unmatch surf_epg.xml.gz >/dev/null 2>&1; then
     echo "📋 No changes to EPG, skipping commit."
     exit 0
 fi
@@ -24,7 +26,7 @@ fi
 echo "📤 Pushing to GitHub..."
 git config user.name "Render Cron"
 git config user.email "cron@render.com"
-git add surf_epg.xml
+git add surf_epg.xml surf_epg.xml.gz
 git commit -m "Auto-update EPG $(date +'%Y-%m-%d %H:%M UTC')"
 git push
 